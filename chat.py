@@ -1,10 +1,22 @@
-from src.ingestion import fetch_from_drive
+import argparse
+from src.ingestion import fetch_from_drive, load_snapshot, save_snapshot, index_datasets
 from src.conversational_agent import start_conversation
 import config
 
 def main():
-    print("Loading data from Google Drive...")
-    datasets = fetch_from_drive(folder_id=config.DRIVE_FOLDER_ID)
+    parser = argparse.ArgumentParser(description="Chat with your data")
+    parser.add_argument("--no-cache", action="store_true", help="re-download datasets instead of using the local cache")
+    parser.add_argument("--snapshot", help="directory to restore datasets from (saved there on first run)")
+    args = parser.parse_args()
+    datasets = load_snapshot(args.snapshot) if args.snapshot else None
+    if datasets is None:
+        print("Loading data from Google Drive...")
+        datasets = fetch_from_drive(folder_id=config.DRIVE_FOLDER_ID, use_cache=not args.no_cache)
+        if args.snapshot:
+            save_snapshot(datasets, args.snapshot)
+    else:
+        print(f"Restored datasets from snapshot {args.snapshot}")
+    datasets = index_datasets(datasets)
     print(f"\n✓ Loaded {len(datasets)} datasets:")
     for name, df in datasets.items():
         print(f"  • {name}: {df.shape[0]:,} rows")
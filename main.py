@@ -1,33 +1,42 @@
-from src.ingestion import fetch_from_drive
+import argparse
+from src.ingestion import fetch_from_drive, index_datasets
 from src.agent import generate_user_personas
 import config
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate AI-powered user personas")
+    parser.add_argument("--no-cache", action="store_true", help="re-download datasets instead of using the local cache")
+    args = parser.parse_args()
     #formatting 
     print("=" * 60)
     print("AI-POWERED USER PERSONA GENERATOR")
     print("=" * 60)
     #fetch data
     print("\nFetching data from Google Drive...")
-    datasets = fetch_from_drive(folder_id=config.DRIVE_FOLDER_ID)
+    datasets = index_datasets(fetch_from_drive(folder_id=config.DRIVE_FOLDER_ID, use_cache=not args.no_cache))
     print(f"\nLoaded {len(datasets)} datasets:")
     for name, df in datasets.items():
         print(f"  • {name}: {df.shape[0]:,} rows × {df.shape[1]} columns")
-    #generate random user personas
+    #generate random user personas, streaming them to the console and output file
     print("\n[Step 2] Generating AI-powered user personas...")
     num_users = 5
-    personas, user_data = generate_user_personas(datasets, num_users=num_users)
-    #display
-    print("\n" + "=" * 60)
-    print("GENERATED PERSONAS")
-    print("=" * 60)
-    print(personas)
     output_file = "user_personas_output.txt"
+    banner_printed = False
     with open(output_file, 'w') as f:
         f.write("=" * 60 + "\n")
         f.write("AI-GENERATED USER PERSONAS\n")
         f.write("=" * 60 + "\n\n")
-        f.write(personas)
+        def write_text(text):
+            nonlocal banner_printed
+            #the banner waits for the first persona text so the selection progress lines stay above it
+            if not banner_printed:
+                print("\n" + "=" * 60)
+                print("GENERATED PERSONAS")
+                print("=" * 60)
+                banner_printed = True
+            f.write(text)
+            print(text, end='', flush=True)
+        personas, user_data = generate_user_personas(datasets, num_users=num_users, on_text=write_text)
     print(f"\n✓ Personas saved to: {output_file}")
     print("\n[Complete] Run again to generate new random personas!")
 
@@ -1,14 +1,113 @@
 import anthropic
 import os
 import json
-import random
+import asyncio
+import gc
+import math
+import shelve
+import hashlib
+import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
+from src.ingestion import select_rows
 
 load_dotenv()
+# Generated personas are cached here, keyed on a hash of the formatted user data
+PERSONA_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'data-insight', 'persona_cache.db')
+# Users per Claude request; larger samples are split into concurrent requests
+PERSONA_BATCH_SIZE = 5
+# Model that writes the personas
+PERSONA_MODEL = "claude-sonnet-4-20250514"
+# Users profiled per chunk in prepare_user_data, bounding the size of merged intermediates
+USER_CHUNK_SIZE = 256
+# Chunks with at most this many users skip groupby in favour of flat np.bincount histograms
+SMALL_SAMPLE_USERS = 64
+
+def _mode_by_user(user_ids, values, n_values):
+    """Most frequent small non-negative integer per user, via one flat bincount"""
+    codes, uniques = pd.factorize(user_ids)
+    values = values.to_numpy(np.int64)
+    n_values = max(n_values, int(values.max()) + 1)
+    hist = np.bincount(codes * n_values + values, minlength=len(uniques) * n_values)
+    #argmax returns the smallest value on ties, matching Series.mode()[0]
+    return pd.Series(hist.reshape(len(uniques), n_values).argmax(axis=1), index=uniques)
+
+def _bincount_metrics(uop):
+    """Compute (total_items, avg_cart_size, reorder_rate) per user with flat np.bincount calls"""
+    codes = uop['user_id'].cat.codes.to_numpy()
+    index = pd.Index(uop['user_id'].cat.categories, name='user_id')
+    items = np.bincount(codes, minlength=len(index))
+    #each order belongs to a single user, so its first row attributes it
+    _, first = np.unique(uop['order_id'].to_numpy(), return_index=True)
+    n_orders = np.bincount(codes[first], minlength=len(index))
+    if 'reordered' in uop.columns:
+        reorder_rate = np.bincount(codes, weights=uop['reordered'].to_numpy(), minlength=len(index)) / items
+    else:
+        reorder_rate = np.zeros(len(index))
+    total_items = pd.Series(items, index=index)
+    avg_cart_size = pd.Series(items / n_orders, index=index)
+    return total_items, avg_cart_size, pd.Series(reorder_rate, index=index)
+
+def _top_by_user_bincount(df, column, k):
+    """Top-k values of a categorical column per user from one flat (user x value) histogram"""
+    users = df['user_id'].cat.categories
+    values = df[column].cat.categories
+    user_codes = df['user_id'].cat.codes.to_numpy().astype(np.int64)
+    value_codes = df[column].cat.codes.to_numpy()
+    valid = value_codes >= 0
+    hist = np.bincount(
+        user_codes[valid] * len(values) + value_codes[valid],
+        minlength=len(users) * len(values)
+    ).reshape(len(users), len(values))
+    result = {}
+    for row, user_id in enumerate(users):
+        counts = hist[row]
+        n_top = min(k, np.count_nonzero(counts))
+        if n_top == 0:
+            continue
+        top = np.argpartition(-counts, n_top - 1)[:n_top]
+        top = top[np.lexsort((top, -counts[top]))]
+        result[user_id] = {str(values[i]): int(counts[i]) for i in top}
+    return result
+
+# Static instructions sent as the system prompt; only the user profiles vary per call.
+# At ~160 tokens they are below the API's 1024-token minimum for prompt caching, so no cache_control
+PERSONA_INSTRUCTIONS = """You are a data analyst specializing in customer behavior and market segmentation.
+
+You will be given shopping data for a set of users. For EACH user, provide:
+1. **Persona Name**: A creative, descriptive name (e.g., "Budget-Conscious Health Enthusiast")
+2. **Demographic Profile**: Inferred age range, lifestyle, household type
+3. **Shopping Behavior**: Key patterns and preferences
+4. **Product Preferences**: What they buy and why
+5. **Business Insights**: How to target/retain this customer
+6. **Recommended Actions**: Specific marketing or product recommendations
+
+Format each persona clearly with the user_id, then the analysis."""
+
+# Per-user block of the persona prompt, filled by PersonaAgent._format_user_data
+USER_TEMPLATE = """
+USER ID: {user_id}
+---
+Metrics:
+- Total Orders: {total_orders}
+- Total Items: {total_items_purchased}
+- Average Cart Size: {avg_cart_size}
+- Reorder Rate: {reorder_rate}%
+
+Top Products Purchased:
+{top_products}
+
+Department Preferences:
+{department_preferences}
+
+Shopping Patterns:
+- Preferred Day: {preferred_day}
+- Preferred Hour: {preferred_hour}:00
+"""
 
 class PersonaAgent:
     def __init__(self):
-        self.client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
     
     def prepare_user_data(self, datasets, num_users=5):
         """
@@ -23,51 +122,91 @@ class PersonaAgent:
         else:
             raise KeyError("Could not find order_products dataset")
         products = datasets.get('products')
-        user_ids = random.sample(list(orders['user_id'].unique()), num_users)
+        #product names travel as categorical codes, so grouping hashes int codes, not strings
+        product_lookup = products[['product_id', 'department_id']].assign(
+            product_name=products['product_name'].astype('category')
+        )
+        if 'department_id' in products.columns and 'departments' in datasets:
+            dept_map = datasets['departments'].set_index('department_id')['department'].astype('category')
+        else:
+            dept_map = None
+        rng = np.random.default_rng()
+        user_ids = rng.choice(orders['user_id'].unique(), size=num_users, replace=False)
+        #profile users in bounded chunks so the merged intermediates stay small
         user_profiles = []
-        for user_id in user_ids:
-            user_orders = orders[orders['user_id'] == user_id]
-            order_ids = user_orders['order_id'].tolist()
-            user_order_products = order_products[order_products['order_id'].isin(order_ids)]
-            user_items = user_order_products.merge(
-                products[['product_id', 'product_name', 'aisle_id', 'department_id']], 
-                on='product_id', 
-                how='left'
-            )
-            #shopping metrics
-            total_orders = len(user_orders)
-            total_items = len(user_items)
-            avg_cart_size = user_items.groupby('order_id').size().mean()
-            reorder_rate = user_order_products['reordered'].mean() if 'reordered' in user_order_products.columns else 0
-            #top products and categories
-            top_products = user_items['product_name'].value_counts().head(10).to_dict()
-            if 'department_id' in user_items.columns and 'departments' in datasets:
-                dept_counts = user_items.merge(
-                    datasets['departments'], 
-                    on='department_id'
-                )['department'].value_counts().head(5).to_dict()
-            else:
-                dept_counts = {}
-            # patterns
-            if 'order_dow' in user_orders.columns:
-                preferred_day = user_orders['order_dow'].mode()[0] if len(user_orders['order_dow'].mode()) > 0 else None
-            else:
-                preferred_day = None  
-            if 'order_hour_of_day' in user_orders.columns:
-                preferred_hour = user_orders['order_hour_of_day'].mode()[0] if len(user_orders['order_hour_of_day'].mode()) > 0 else None
+        for chunk in np.array_split(user_ids, max(1, math.ceil(len(user_ids) / USER_CHUNK_SIZE))):
+            user_profiles.extend(self._profile_users(chunk, orders, order_products, product_lookup, dept_map))
+            gc.collect()
+        return user_profiles
+    
+    def _profile_users(self, user_ids, orders, order_products, product_lookup, dept_map):
+        """Build shopping profiles for the given users"""
+        #select the users' rows once (indexed lookup after index_datasets),
+        #narrowing join keys so the merge/groupby hash tables move less memory
+        u_orders = select_rows(orders, 'user_id', user_ids).astype({'user_id': 'int32', 'order_id': 'int32'})
+        op_dtypes = {'order_id': 'int32', 'product_id': 'int32'}
+        if 'reordered' in order_products.columns:
+            op_dtypes['reordered'] = 'int8'
+        #only the key/metric columns take part in the merges below
+        u_order_products = select_rows(order_products, 'order_id', u_orders['order_id'])[list(op_dtypes)].astype(op_dtypes)
+        #then merge everything in one stroke
+        uop = u_order_products.merge(
+            u_orders[['order_id', 'user_id']],
+            on='order_id',
+            how='inner',
+            validate='m:1',
+            copy=False
+        )
+        uop = uop.merge(
+            product_lookup,
+            on='product_id',
+            how='left',
+            validate='m:1',
+            copy=False
+        )
+        uop['user_id'] = uop['user_id'].astype('category')
+        #shopping metrics; item counts and cart sizes share one pass over uop
+        total_orders = u_orders.groupby('user_id', sort=False).size()
+        if len(user_ids) <= SMALL_SAMPLE_USERS:
+            total_items, avg_cart_size, reorder_rate = _bincount_metrics(uop)
+        else:
+            cart = uop.groupby(['user_id', 'order_id'], observed=True, sort=False).size()
+            cart_by_user = cart.groupby(level='user_id', observed=True, sort=False)
+            total_items = cart_by_user.sum()
+            avg_cart_size = cart_by_user.mean()
+            if 'reordered' in uop.columns:
+                reorder_rate = uop.groupby('user_id', observed=True, sort=False)['reordered'].mean()
             else:
-                preferred_hour = None
-            
+                reorder_rate = pd.Series(0.0, index=total_orders.index)
+        #top products and categories
+        top_products = self._top_by_user(uop, 'product_name', 10)
+        if dept_map is not None:
+            uop['department'] = uop['department_id'].map(dept_map)
+            dept_counts = self._top_by_user(uop, 'department', 5)
+        else:
+            dept_counts = {}
+        #merged rows are no longer needed once aggregated
+        del uop, u_order_products
+        # patterns
+        modes = pd.DataFrame({
+            col: _mode_by_user(u_orders['user_id'], u_orders[col], n_values)
+            for col, n_values in [('order_dow', 7), ('order_hour_of_day', 24)]
+            if col in u_orders.columns
+        })
+        user_profiles = []
+        for user_id in total_orders.index:
+            preferred_day = modes.at[user_id, 'order_dow'] if 'order_dow' in modes.columns else None
+            preferred_hour = modes.at[user_id, 'order_hour_of_day'] if 'order_hour_of_day' in modes.columns else None
             user_profiles.append({
                 "user_id": int(user_id),
                 "metrics": {
-                    "total_orders": int(total_orders),
-                    "total_items_purchased": int(total_items),
-                    "avg_cart_size": round(float(avg_cart_size), 2),
-                    "reorder_rate": round(float(reorder_rate * 100), 2)
+                    "total_orders": int(total_orders[user_id]),
+                    "total_items_purchased": int(total_items.get(user_id, 0)),
+                    "avg_cart_size": round(float(avg_cart_size.get(user_id, np.nan)), 2),
+                    "reorder_rate": round(float(reorder_rate.get(user_id, np.nan) * 100), 2)
                 },
-                "top_products": {str(k): int(v) for k, v in list(top_products.items())[:10]},
-                "department_preferences": {str(k): int(v) for k, v in list(dept_counts.items())[:5]},
+                "top_products": top_products.get(user_id, {}),
+                "department_preferences": dept_counts.get(user_id, {}),
                 "shopping_patterns": {
                     "preferred_day_of_week": int(preferred_day) if preferred_day is not None else None,
                     "preferred_hour": int(preferred_hour) if preferred_hour is not None else None
@@ -75,66 +214,89 @@ class PersonaAgent:
             })
         return user_profiles
     
-    def generate_personas(self, user_profiles):
+    def _top_by_user(self, df, column, k):
+        """Most frequent values of a column per user, as {user_id: {value: count}}"""
+        if len(df['user_id'].cat.categories) <= SMALL_SAMPLE_USERS and isinstance(df[column].dtype, pd.CategoricalDtype):
+            return _top_by_user_bincount(df, column, k)
+        counts = df.groupby(['user_id', column], observed=True, sort=False).size().rename('n').reset_index()
+        #partial sort per user instead of sorting each full distribution
+        top_idx = counts.groupby('user_id', observed=True, sort=False, group_keys=False)['n'].nlargest(k).index
+        top = counts.loc[top_idx]
+        #decode (categorical) values for the winners only
+        return {
+            user_id: dict(zip(grp[column].astype(str), grp['n'].tolist()))
+            for user_id, grp in top.groupby('user_id', observed=True, sort=False)
+        }
+    
+    async def generate_personas(self, user_profiles, on_text=None):
         """
         Generate user personas using Claude AI
+        Profiles are sent in batches of PERSONA_BATCH_SIZE, with the batches running concurrently
+        on_text: optional callback receiving the response text as it streams in
         """
         #  context for AI
         context = self._format_user_data(user_profiles)
-        prompt = f"""You are a data analyst specializing in customer behavior and market segmentation. 
-        
-Analyze the shopping data for these {len(user_profiles)} users and create detailed user personas.
-
-{context}
-
-For EACH user, provide:
-1. **Persona Name**: A creative, descriptive name (e.g., "Budget-Conscious Health Enthusiast")
-2. **Demographic Profile**: Inferred age range, lifestyle, household type
-3. **Shopping Behavior**: Key patterns and preferences
-4. **Product Preferences**: What they buy and why
-5. **Business Insights**: How to target/retain this customer
-6. **Recommended Actions**: Specific marketing or product recommendations
+        #the model, instructions and batching shape the response too, so changing them misses the cache
+        cache_key = hashlib.blake2b(
+            "\0".join([PERSONA_MODEL, PERSONA_INSTRUCTIONS, str(PERSONA_BATCH_SIZE), context]).encode(),
+            digest_size=16
+        ).hexdigest()
+        os.makedirs(os.path.dirname(PERSONA_CACHE_PATH), exist_ok=True)
+        with shelve.open(PERSONA_CACHE_PATH) as cache:
+            if cache_key in cache:
+                if on_text:
+                    on_text(cache[cache_key])
+                return cache[cache_key]
+        batches = [
+            user_profiles[i:i + PERSONA_BATCH_SIZE]
+            for i in range(0, len(user_profiles), PERSONA_BATCH_SIZE)
+        ]
+        #first batch streams live, later batches are emitted in order once done
+        responses = await asyncio.gather(*[
+            self._generate_batch(batch, on_text if i == 0 else None)
+            for i, batch in enumerate(batches)
+        ])
+        if on_text:
+            for text in responses[1:]:
+                on_text("\n\n" + text)
+        personas = "\n\n".join(responses)
+        with shelve.open(PERSONA_CACHE_PATH) as cache:
+            cache[cache_key] = personas
+        return personas
+    
+    async def _generate_batch(self, user_profiles, on_text=None):
+        """Stream personas for one batch of users"""
+        prompt = f"""Analyze the shopping data for these {len(user_profiles)} users and create detailed user personas.
 
-Format each persona clearly with the user_id, then the analysis."""
+{self._format_user_data(user_profiles)}"""
 
-        response = self.client.messages.create(
-            model="claude-sonnet-4-20250514",
+        async with self.client.messages.stream(
+            model=PERSONA_MODEL,
             max_tokens=4096,
+            system=PERSONA_INSTRUCTIONS,
             messages=[{"role": "user", "content": prompt}]
-        )
+        ) as stream:
+            async for text in stream.text_stream:
+                if on_text:
+                    on_text(text)
+            response = await stream.get_final_message()
         return response.content[0].text
     
     def _format_user_data(self, user_profiles):
         """Format user data for AI consumption"""
-        formatted= []
-        for profile in user_profiles:
-            user_str = f"""
-USER ID: {profile['user_id']}
----
-Metrics:
-- Total Orders: {profile['metrics']['total_orders']}
-- Total Items: {profile['metrics']['total_items_purchased']}
-- Average Cart Size: {profile['metrics']['avg_cart_size']}
-- Reorder Rate: {profile['metrics']['reorder_rate']}%
-
-Top Products Purchased:
-{self._format_dict(profile['top_products'])}
-
-Department Preferences:
-{self._format_dict(profile['department_preferences'])}
-
-Shopping Patterns:
-- Preferred Day: {self._day_name(profile['shopping_patterns']['preferred_day_of_week'])}
-- Preferred Hour: {profile['shopping_patterns']['preferred_hour']}:00
-"""
-            formatted.append(user_str)
-        
+        formatted = [
+            USER_TEMPLATE.format_map({
+                "user_id": profile['user_id'],
+                **profile['metrics'],
+                "top_products": "\n".join(f"  • {k}: {v}" for k, v in profile['top_products'].items()),
+                "department_preferences": "\n".join(f"  • {k}: {v}" for k, v in profile['department_preferences'].items()),
+                "preferred_day": self._day_name(profile['shopping_patterns']['preferred_day_of_week']),
+                "preferred_hour": profile['shopping_patterns']['preferred_hour'],
+            })
+            for profile in user_profiles
+        ]
         return "\n".join(formatted)
     
-    def _format_dict(self, d):
-        """Pretty print dictionary"""
-        return "\n".join([f"  • {k}: {v}" for k, v in d.items()])
-    
     def _day_name(self, day_num):
         """Convert day number to name"""
         if day_num is None:
@@ -142,9 +304,10 @@ Shopping Patterns:
         days = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
         return days[day_num] if 0 <= day_num < 7 else "N/A"
 
-def generate_user_personas(datasets, num_users=5):
+def generate_user_personas(datasets, num_users=5, on_text=None):
     """
     Main function to generate random user personas
+    on_text: optional callback receiving persona text as it is generated
     """
     agent = PersonaAgent()
     #prepare random user data
@@ -152,7 +315,7 @@ def generate_user_personas(datasets, num_users=5):
     user_profiles = agent.prepare_user_data(datasets, num_users)
     print(f"Generating personas for users: {[p['user_id'] for p in user_profiles]}")
     #generate personas with agent
-    personas = agent.generate_personas(user_profiles)
+    personas = asyncio.run(agent.generate_personas(user_profiles, on_text))
     return personas, user_profiles
 
 if __name__ == "__main__":
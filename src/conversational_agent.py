@@ -1,21 +1,117 @@
 import anthropic
 import os
 import json
-import matplotlib.pyplot as plt
+import asyncio
+import hashlib
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import matplotlib
 import seaborn as sns
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from datetime import datetime
+from collections import OrderedDict
+from scipy.sparse import csr_matrix, save_npz, load_npz
 from dotenv import load_dotenv
+from src.ingestion import select_rows, index_by, write_atomic, CACHE_DIR
 
 load_dotenv()
 sns.set_style("whitegrid")
-plt.rcParams['figure.figsize'] = (12, 6)
+matplotlib.rcParams['figure.figsize'] = (12, 6)
+# Results of read-only tool calls kept per agent, least recently used evicted first
+TOOL_CACHE_SIZE = 128
+# Tools with side effects, never served from the result cache
+UNCACHED_TOOLS = {"create_visualization"}
+# Charts are for on-screen reading, so screen resolution and a fast PNG encode
+CHART_DPI = 100
+CHART_PNG_COMPRESS_LEVEL = 1
+# Recent messages always sent verbatim; once this many more have piled up beyond them,
+# the older turns are folded into a running summary by a small model
+HISTORY_WINDOW = 12
+HISTORY_SUMMARY_BATCH = 8
+SUMMARY_MODEL = "claude-3-5-haiku-20241022"
+# Tool results are clipped to this many characters in the text handed to the summarizer
+SUMMARY_TOOL_RESULT_CHARS = 2000
+
+def _lowercase_names(names):
+    """Lowercased names as a numpy string array for substring search, with missing names empty"""
+    return np.asarray(names.astype(object).fillna('').astype(str).str.lower(), dtype=str)
+
+def _fingerprint(*columns):
+    """Short content hash of some columns, for keying on-disk caches of derived data"""
+    h = hashlib.blake2b(digest_size=16)
+    for column in columns:
+        h.update(pd.util.hash_pandas_object(column, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+# Static analyst instructions sent as a cacheable system prompt, followed by the loaded datasets
+ANALYST_INSTRUCTIONS = """You are a data analyst answering questions about Instacart grocery order data.
+
+Use the provided tools to look up users, products, departments, product pairings and reorder rates,
+and to create charts. Base every number you report on tool results, and say so when the data
+doesn't cover a question."""
+
+def _dataset_overview(datasets):
+    """One line per loaded dataset with its shape and columns, for the system prompt"""
+    return "\n".join(
+        f"- {name}: {len(df)} rows; columns: {', '.join(map(str, df.columns))}"
+        for name, df in datasets.items()
+    )
+
+def _transcript(messages):
+    """Render history messages as plain text for the summarizer"""
+    lines = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        for block in content:
+            if block["type"] == "text":
+                lines.append(f"{message['role']}: {block['text']}")
+            elif block["type"] == "tool_use":
+                lines.append(f"assistant called {block['name']} with {json.dumps(block['input'], default=str)}")
+            elif block["type"] == "tool_result":
+                lines.append(f"tool result: {str(block['content'])[:SUMMARY_TOOL_RESULT_CHARS]}")
+    return "\n".join(lines)
+
+def _name_matches(lowercase_names, query):
+    """Case-insensitive substring mask over a _lowercase_names array"""
+    return np.char.find(lowercase_names, str(query).lower()) >= 0
 
 class ConversationalAnalysisAgent:
     def __init__(self, datasets):
-        self.client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        # One loop for the whole session so the async client's connections stay usable
+        self._loop = asyncio.new_event_loop()
         self.datasets = datasets
+        self._build_views()
         self.conversation_history = []
+        # Summary of conversation_history[:_summarized], sent in place of those messages
+        self._summary = ""
+        self._summarized = 0
         self.tools = self._define_tools()
+        #the tools schema and system prompt are identical on every call, so let Anthropic cache them
+        self.tools[-1]["cache_control"] = {"type": "ephemeral"}
+        self.system = [{
+            "type": "text",
+            "text": f"{ANALYST_INSTRUCTIONS}\n\nLoaded datasets:\n{_dataset_overview(datasets)}",
+            "cache_control": {"type": "ephemeral"}
+        }]
+        # Tools run on worker threads, so the result cache is shared behind a lock
+        self._tool_cache = OrderedDict()
+        self._tool_cache_lock = threading.Lock()
+        # Chart-ready {label: value} data by (data_source, department_filter, limit),
+        # filled by the tools that compute it so a later chart of the same data is free
+        self._viz_cache = {}
+        # One Agg figure reused for every chart instead of pyplot's global figure registry
+        self._figure = Figure(figsize=(12, 6))
+        FigureCanvasAgg(self._figure)
+        self._figure_lock = threading.Lock()
+        # Co-occurrence matrix, built on first use; concurrent tool calls build it only once
+        self._cooccurrence_data = None
+        self._cooccurrence_lock = threading.Lock()
         
     def _define_tools(self):
         """Define tools the agent can use to query data"""
@@ -151,7 +247,23 @@ class ConversationalAnalysisAgent:
         ]
     
     def _execute_tool(self, tool_name, tool_input):
-        """Execute the requested tool and return results"""
+        """Execute the requested tool and return results, reusing earlier results of read-only tools"""
+        if tool_name in UNCACHED_TOOLS:
+            return self._run_tool(tool_name, tool_input)
+        key = (tool_name, json.dumps(tool_input, sort_keys=True, default=str))
+        with self._tool_cache_lock:
+            if key in self._tool_cache:
+                self._tool_cache.move_to_end(key)
+                return self._tool_cache[key]
+        result = self._run_tool(tool_name, tool_input)
+        with self._tool_cache_lock:
+            self._tool_cache[key] = result
+            if len(self._tool_cache) > TOOL_CACHE_SIZE:
+                self._tool_cache.popitem(last=False)
+        return result
+    
+    def _run_tool(self, tool_name, tool_input):
+        """Dispatch a tool call to its implementation"""
         
         if tool_name == "get_user_orders":
             return self._get_user_orders(tool_input["user_id"])
@@ -187,61 +299,117 @@ class ConversationalAnalysisAgent:
             )
         return {"error": f"Unknown tool: {tool_name}"}
     
+    def _build_views(self):
+        """
+        Merge product names and departments into order_products once, indexed by order_id,
+        plus a narrow copy indexed by product_id for per-product lookups
+        """
+        order_products = self.datasets.get('order_products__train', self.datasets.get('order_products'))
+        products = self.datasets['products']
+        #categorical names keep the merged view small and make value_counts an int histogram
+        lookup = products[['product_id', 'department_id']].assign(
+            product_name=products['product_name'].astype('category')
+        )
+        #only the columns the tools read go through the merge
+        op_cols = [c for c in ['order_id', 'product_id', 'reordered'] if c in order_products.columns]
+        op = order_products[op_cols].merge(lookup, on='product_id', how='left', validate='m:1', copy=False)
+        if 'departments' in self.datasets:
+            dept_map = self.datasets['departments'].set_index('department_id')['department'].astype('category')
+            op['department'] = op['department_id'].map(dept_map)
+        self._op_by_order = index_by(op, 'order_id')
+        product_cols = [c for c in ['product_id', 'order_id', 'reordered'] if c in op.columns]
+        self._op_by_product = index_by(op[product_cols], 'product_id')
+        self._product_names = products.set_index('product_id')['product_name']
+        #lowercased once so name lookups are a plain substring scan instead of a regex per call
+        self._product_names_lower = _lowercase_names(products['product_name'])
+        if 'departments' in self.datasets:
+            self._department_names_lower = _lowercase_names(self.datasets['departments']['department'])
+        #per-product order counts and reorder rate, shared by analyze_product and get_reorder_stats
+        aggs = {'total_orders': ('product_id', 'size'), 'unique_orders': ('order_id', 'nunique')}
+        if 'reordered' in op.columns:
+            aggs['reorder_rate'] = ('reordered', 'mean')
+        self._product_agg = self._op_by_product.groupby('product_id').agg(**aggs)
+        #reorder rate by product, for products with at least 10 orders
+        if 'reordered' in op.columns:
+            stats = self._product_agg.loc[self._product_agg['total_orders'] >= 10, ['reorder_rate', 'total_orders']]
+            stats = stats.rename(columns={'reorder_rate': 'mean', 'total_orders': 'count'})
+            self._reorder_stats = stats.assign(product_name=self._product_names.reindex(stats.index))
+        else:
+            self._reorder_stats = None
+    
+    def _top_counts(self, values, limit):
+        """Most frequent values as {value: count}, skipping categories that never occur"""
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            counts = values.value_counts().head(limit)
+            return {str(k): int(v) for k, v in counts.items()}
+        #histogram the category codes and partially select the top limit instead of sorting every count
+        codes = values.cat.codes.to_numpy()
+        counts = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+        top = np.flatnonzero(counts)
+        if len(top) > limit > 0:
+            top = top[np.argpartition(-counts[top], limit - 1)[:limit]]
+        #ties are broken by category order so results are deterministic
+        top = top[np.lexsort((top, -counts[top]))][:max(limit, 0)]
+        return {str(k): int(v) for k, v in zip(values.cat.categories[top], counts[top])}
+    
     def _get_user_orders(self, user_id):
         """Get detailed order information for a user"""
         orders = self.datasets['orders']
-        order_products = self.datasets.get('order_products__train', self.datasets.get('order_products'))
-        products = self.datasets['products']
-        user_orders = orders[orders['user_id'] == user_id]
+        user_orders = select_rows(orders, 'user_id', [user_id])
         if len(user_orders) == 0:
             return {"error": f"No orders found for user {user_id}"}
         
         order_ids = user_orders['order_id'].tolist()
-        user_items = order_products[order_products['order_id'].isin(order_ids)]
-        user_items = user_items.merge(products, on='product_id', how='left')
-        top_products = user_items['product_name'].value_counts().head(10).to_dict()
+        user_items = select_rows(self._op_by_order, 'order_id', order_ids)
+        #mean items per order is items over distinct orders, without building groups
+        orders_with_items = len(np.unique(user_items['order_id'].to_numpy()))
         return {
             "user_id": int(user_id),
             "total_orders": int(len(user_orders)),
             "total_items": int(len(user_items)),
-            "avg_cart_size": float(user_items.groupby('order_id').size().mean()),
-            "top_products": {str(k): int(v) for k, v in top_products.items()}
+            "avg_cart_size": float(len(user_items) / orders_with_items) if orders_with_items else float('nan'),
+            "top_products": self._top_counts(user_items['product_name'], 10)
         }
     
     def _analyze_product(self, product_name):
         """Analyze a specific product"""
         products = self.datasets['products']
-        order_products = self.datasets.get('order_products__train', self.datasets.get('order_products'))
-        matching = products[products['product_name'].str.contains(product_name, case=False, na=False)]
+        matching = products[_name_matches(self._product_names_lower, product_name)]
         
         if len(matching) == 0:
             return {"error": f"No products found matching '{product_name}'"}
         product_ids = matching['product_id'].tolist()
-        product_orders = order_products[order_products['product_id'].isin(product_ids)]
+        agg = self._product_agg.loc[self._product_agg.index.intersection(product_ids)]
+        total_orders = int(agg['total_orders'].sum())
+        if len(agg) > 1:
+            #an order holding several matches counts once, so distinct orders need the rows themselves
+            unique_orders = select_rows(self._op_by_product, 'product_id', agg.index)['order_id'].nunique()
+        else:
+            unique_orders = agg['unique_orders'].sum()
         result = {
             "matching_products": matching['product_name'].tolist()[:10],
-            "total_orders": int(len(product_orders)),
-            "unique_customers": int(product_orders['order_id'].nunique()) if 'order_id' in product_orders.columns else 0
+            "total_orders": total_orders,
+            "unique_customers": int(unique_orders)
         }
-        if 'reordered' in product_orders.columns:
-            result["reorder_rate"] = float(product_orders['reordered'].mean() * 100)
+        if 'reorder_rate' in agg.columns:
+            reorders = (agg['reorder_rate'] * agg['total_orders']).sum()
+            result["reorder_rate"] = float(reorders / total_orders * 100) if total_orders else float('nan')
         return result
     
     def _get_top_products(self, department=None, limit=10):
         """Get top products overall or by department"""
-        products = self.datasets['products']
-        order_products = self.datasets.get('order_products__train', self.datasets.get('order_products'))
-        merged = order_products.merge(products, on='product_id', how='left')
+        merged = self._op_by_order
         #filter by department if specified
         if department and 'departments' in self.datasets:
             departments = self.datasets['departments']
-            dept_ids = departments[departments['department'].str.contains(department, case=False, na=False)]['department_id'].tolist()
+            dept_ids = departments[_name_matches(self._department_names_lower, department)]['department_id'].tolist()
             merged = merged[merged['department_id'].isin(dept_ids)]
-        top_products = merged['product_name'].value_counts().head(limit)
         
+        top_products = self._top_counts(merged['product_name'], limit)
+        self._viz_cache[("top_products", department, limit)] = top_products
         return {
             "department_filter": department,
-            "top_products": {str(k): int(v) for k, v in top_products.items()}
+            "top_products": top_products
         }
     
     def _analyze_department(self, department_name):
@@ -251,14 +419,13 @@ class ConversationalAnalysisAgent:
         
         departments = self.datasets['departments']
         products = self.datasets['products']
-        order_products = self.datasets.get('order_products__train', self.datasets.get('order_products'))
-        matching_dept = departments[departments['department'].str.contains(department_name, case=False, na=False)]
+        matching_dept = departments[_name_matches(self._department_names_lower, department_name)]
         if len(matching_dept) == 0:
             return {"error": f"No department found matching '{department_name}'"}
         dept_id = matching_dept.iloc[0]['department_id']
         dept_products = products[products['department_id'] == dept_id]
         #orders for this department
-        dept_orders = order_products[order_products['product_id'].isin(dept_products['product_id'])]
+        dept_orders = select_rows(self._op_by_product, 'product_id', dept_products['product_id'])
         return {
             "department_name": matching_dept.iloc[0]['department'],
             "total_products": int(len(dept_products)),
@@ -269,46 +436,95 @@ class ConversationalAnalysisAgent:
     def _find_product_pairs(self, product_name, limit=5):
         """Find products commonly bought with the specified product"""
         products = self.datasets['products']
-        order_products = self.datasets.get('order_products__train', self.datasets.get('order_products'))
         #find product
-        matching = products[products['product_name'].str.contains(product_name, case=False, na=False)]
+        matching = products[_name_matches(self._product_names_lower, product_name)]
         if len(matching) == 0:
             return {"error": f"No products found matching '{product_name}'"}
         product_id = matching.iloc[0]['product_id']
-        orders_with_product = order_products[order_products['product_id'] == product_id]['order_id'].unique
-        other_products = order_products[
-            (order_products['order_id'].isin(orders_with_product)) & 
-            (order_products['product_id'] != product_id)
-        ]
-        #count co-occurrences
-        paired = other_products.merge(products, on='product_id', how='left')
-        top_pairs = paired['product_name'].value_counts().head(limit)
+        #one sparse row of the co-occurrence matrix holds every product bought with this one
+        cooc, product_ids = self._cooccurrence
+        col = product_ids.get_indexer([product_id])[0]
+        pairs = {}
+        if col >= 0:
+            row = cooc.getrow(col)
+            keep = row.indices != col
+            others, counts = row.indices[keep], row.data[keep]
+            #products missing from the products table (or unnamed) are skipped, as in _top_counts
+            names = self._product_names.reindex(product_ids[others]).to_numpy()
+            named = pd.notna(names)
+            others, counts, names = others[named], counts[named], names[named]
+            if len(counts) > limit:
+                top = np.argpartition(-counts, limit - 1)[:limit]
+                others, counts, names = others[top], counts[top], names[top]
+            order = np.lexsort((others, -counts))
+            pairs = {str(name): int(n) for name, n in zip(names[order], counts[order])}
         return {
             "product": matching.iloc[0]['product_name'],
-            "commonly_bought_with": {str(k): int(v) for k, v in top_pairs.items()}
+            "commonly_bought_with": pairs
         }
     
+    @property
+    def _cooccurrence(self):
+        """
+        Sparse product x product co-occurrence counts over all orders, with the product_id
+        of each row/column; built on first use since it is the most expensive view, and
+        persisted in CACHE_DIR keyed on the order/product pairs so later sessions load it
+        """
+        if self._cooccurrence_data is None:
+            with self._cooccurrence_lock:
+                if self._cooccurrence_data is None:
+                    cooc, product_ids = self._load_cooccurrence()
+                    #pandas builds an Index's hash table lazily and not thread-safely; build the
+                    #ones _find_product_pairs looks up here so concurrent calls only read them
+                    product_ids.get_indexer(product_ids[:1])
+                    self._product_names.index.get_indexer(product_ids[:1])
+                    self._cooccurrence_data = cooc, product_ids
+        return self._cooccurrence_data
+    
+    def _load_cooccurrence(self):
+        """The co-occurrence matrix and product ids, from CACHE_DIR or built and saved there"""
+        op = self._op_by_order
+        path = os.path.join(CACHE_DIR, f"cooccurrence-{_fingerprint(op['order_id'], op['product_id'])}")
+        if os.path.exists(path + '.npz'):
+            return load_npz(path + '.npz').tocsr(), pd.Index(np.load(path + '.ids.npy'))
+        order_codes, _ = pd.factorize(op['order_id'])
+        product_codes, product_ids = pd.factorize(op['product_id'])
+        baskets = csr_matrix(
+            (np.ones(len(op), dtype=np.int32), (order_codes, product_codes)),
+            shape=(order_codes.max() + 1 if len(op) else 0, len(product_ids))
+        )
+        cooc = (baskets.T @ baskets).tocsr()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        #unique temp names keep concurrent sessions from clobbering each other's writes;
+        #the matrix is renamed into place last, so its presence marks a complete entry
+        write_atomic(path + '.ids.npy', lambda f: np.save(f, np.asarray(product_ids)))
+        write_atomic(path + '.npz', lambda f: save_npz(f, cooc))
+        #pairs built from earlier data are never read again and are large for the full dataset
+        current = os.path.basename(path) + '.'
+        for name in os.listdir(CACHE_DIR):
+            if name.startswith('cooccurrence-') and not name.startswith(current):
+                try:
+                    os.remove(os.path.join(CACHE_DIR, name))
+                except OSError:
+                    pass
+        return cooc, pd.Index(product_ids)
+    
     def _get_reorder_stats(self, sort_by, limit=10):
         """Get products with highest/lowest reorder rates"""
-        products = self.datasets['products']
-        order_products = self.datasets.get('order_products__train', self.datasets.get('order_products'))
-        if 'reordered' not in order_products.columns:
+        if self._reorder_stats is None:
             return {"error": "Reorder data not available"}
-        #reorder rate by product
-        reorder_rates = order_products.groupby('product_id')['reordered'].agg(['mean', 'count'])
-        reorder_rates = reorder_rates[reorder_rates['count'] >= 10]  # Min 10 orders
         if sort_by == "highest":
-            reorder_rates = reorder_rates.sort_values('mean', ascending=False)
+            top_products = self._reorder_stats.nlargest(limit, 'mean')
         else:
-            reorder_rates = reorder_rates.sort_values('mean', ascending=True)
-        top_products = reorder_rates.head(limit)
-        top_products = top_products.merge(products[['product_id', 'product_name']], on='product_id', how='left')
-        result = {}
-        for _, row in top_products.iterrows():
-            result[row['product_name']] = {
-                "reorder_rate": float(row['mean'] * 100),
-                "total_orders": int(row['count'])
-            }
+            top_products = self._reorder_stats.nsmallest(limit, 'mean')
+        result = {
+            name: {"reorder_rate": float(mean * 100), "total_orders": int(count)}
+            for name, mean, count in zip(
+                top_products['product_name'].to_numpy(), top_products['mean'].to_numpy(), top_products['count'].to_numpy()
+            )
+        }
+        if sort_by == "highest":
+            self._viz_cache[("reorder_rates", None, limit)] = {k: v["reorder_rate"] for k, v in result.items()}
         return {
             "sort_by": sort_by,
             "products": result
@@ -320,72 +536,78 @@ class ConversationalAnalysisAgent:
         # Create visualizations directory if it doesn't exist
         os.makedirs("visualizations", exist_ok=True)
         
+        # Reuse data an earlier tool call already computed; only top_products is filtered by department
+        viz_key = (data_source, department_filter if data_source == "top_products" else None, limit)
+        plot_data = self._viz_cache.get(viz_key)
+        
         # Generate data based on source
-        if data_source == "top_products":
-            data = self._get_top_products(department_filter, limit)
-            if "error" in data:
-                return data
-            plot_data = data["top_products"]
+        if plot_data is None:
+            if data_source == "top_products":
+                data = self._get_top_products(department_filter, limit)
+                if "error" in data:
+                    return data
+                plot_data = data["top_products"]
             
-        elif data_source == "reorder_rates":
-            data = self._get_reorder_stats("highest", limit)
-            if "error" in data:
-                return data
-            plot_data = {k: v["reorder_rate"] for k, v in data["products"].items()}
+            elif data_source == "reorder_rates":
+                data = self._get_reorder_stats("highest", limit)
+                if "error" in data:
+                    return data
+                plot_data = {k: v["reorder_rate"] for k, v in data["products"].items()}
             
-        elif data_source == "department_comparison":
-            if 'departments' not in self.datasets:
-                return {"error": "Department data not available"}
+            elif data_source == "department_comparison":
+                if 'departments' not in self.datasets:
+                    return {"error": "Department data not available"}
             
-            departments = self.datasets['departments']
-            products = self.datasets['products']
-            order_products = self.datasets.get('order_products__train', self.datasets.get('order_products'))
-            
-            # Get order counts by department
-            merged = order_products.merge(products, on='product_id', how='left')
-            merged = merged.merge(departments, on='department_id', how='left')
-            dept_counts = merged['department'].value_counts().head(limit)
-            plot_data = dept_counts.to_dict()
+                # Get order counts by department
+                plot_data = self._top_counts(self._op_by_order['department'], limit)
+                self._viz_cache[viz_key] = plot_data
             
-        else:
-            return {"error": f"Unknown data source: {data_source}"}
+            else:
+                return {"error": f"Unknown data source: {data_source}"}
         
-        # Create the plot
-        plt.figure(figsize=(12, 6))
-        
-        if chart_type == "bar":
-            plt.bar(range(len(plot_data)), list(plot_data.values()), color='steelblue')
-            plt.xticks(range(len(plot_data)), list(plot_data.keys()), rotation=45, ha='right')
-            plt.ylabel('Count')
-            
-        elif chart_type == "horizontal_bar":
-            plt.barh(range(len(plot_data)), list(plot_data.values()), color='steelblue')
-            plt.yticks(range(len(plot_data)), list(plot_data.keys()))
-            plt.xlabel('Count')
+        # Draw on the agent's reused figure; the lock serialises concurrent tool calls
+        with self._figure_lock:
+            self._figure.clear()
+            ax = self._figure.add_subplot()
             
-        elif chart_type == "pie":
-            plt.pie(list(plot_data.values()), labels=list(plot_data.keys()), autopct='%1.1f%%')
+            if chart_type == "bar":
+                ax.bar(range(len(plot_data)), list(plot_data.values()), color='steelblue')
+                ax.set_xticks(range(len(plot_data)), list(plot_data.keys()), rotation=45, ha='right')
+                ax.set_ylabel('Count')
+                
+            elif chart_type == "horizontal_bar":
+                ax.barh(range(len(plot_data)), list(plot_data.values()), color='steelblue')
+                ax.set_yticks(range(len(plot_data)), list(plot_data.keys()))
+                ax.set_xlabel('Count')
+                
+            elif chart_type == "pie":
+                ax.pie(list(plot_data.values()), labels=list(plot_data.keys()), autopct='%1.1f%%')
+                
+            elif chart_type == "line":
+                ax.plot(range(len(plot_data)), list(plot_data.values()), marker='o', linewidth=2, markersize=8)
+                ax.set_xticks(range(len(plot_data)), list(plot_data.keys()), rotation=45, ha='right')
+                ax.set_ylabel('Count')
+                ax.grid(True, alpha=0.3)
+                
+            elif chart_type == "scatter":
+                ax.scatter(range(len(plot_data)), list(plot_data.values()), s=100, alpha=0.6, color='steelblue')
+                ax.set_xticks(range(len(plot_data)), list(plot_data.keys()), rotation=45, ha='right')
+                ax.set_ylabel('Count')
+                ax.grid(True, alpha=0.3)
             
-        elif chart_type == "line":
-            plt.plot(range(len(plot_data)), list(plot_data.values()), marker='o', linewidth=2, markersize=8)
-            plt.xticks(range(len(plot_data)), list(plot_data.keys()), rotation=45, ha='right')
-            plt.ylabel('Count')
-            plt.grid(True, alpha=0.3)
+            ax.set_title(title, fontsize=14, fontweight='bold')
+            self._figure.tight_layout()
             
-        elif chart_type == "scatter":
-            plt.scatter(range(len(plot_data)), list(plot_data.values()), s=100, alpha=0.6, color='steelblue')
-            plt.xticks(range(len(plot_data)), list(plot_data.keys()), rotation=45, ha='right')
-            plt.ylabel('Count')
-            plt.grid(True, alpha=0.3)
-        
-        plt.title(title, fontsize=14, fontweight='bold')
-        plt.tight_layout()
-        
-        # Save the plot
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"visualizations/{data_source}_{timestamp}.png"
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close()
+            # Save the plot; charts render well under a second and may run concurrently,
+            # so the file is created with a unique suffix rather than named by timestamp alone
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            fd, filename = tempfile.mkstemp(prefix=f"{data_source}_{timestamp}_", suffix=".png", dir="visualizations")
+            os.close(fd)
+            filename = os.path.relpath(filename)
+            self._figure.savefig(
+                filename, dpi=CHART_DPI, bbox_inches='tight',
+                pil_kwargs={'compress_level': CHART_PNG_COMPRESS_LEVEL}
+            )
         
         return {
             "success": True,
@@ -394,8 +616,17 @@ class ConversationalAnalysisAgent:
             "data_points": len(plot_data)
         }
     
-    def ask(self, question):
-        """Ask a question about the data"""
+    def ask(self, question, on_text=None):
+        """
+        Ask a question about the data
+        on_text: optional callback receiving response text as it streams in
+        """
+        return self._loop.run_until_complete(self._ask_async(question, on_text))
+    
+    async def _ask_async(self, question, on_text=None):
+        """Run one question through Claude, executing requested tools concurrently"""
+        
+        await self._compact_history()
         
         # Add user message to history
         self.conversation_history.append({
@@ -406,12 +637,7 @@ class ConversationalAnalysisAgent:
         print(f"\n🤔 Thinking...")
         
         # Call Claude with tools
-        response = self.client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=4096,
-            tools=self.tools,
-            messages=self.conversation_history
-        )
+        response = await self._stream_response(on_text)
         
         # Process response and handle tool calls
         while response.stop_reason == "tool_use":
@@ -440,22 +666,21 @@ class ConversationalAnalysisAgent:
                 "content": assistant_content
             })
             
-            # Execute all tools and collect results
-            tool_results = []
+            # Execute all tools on worker threads at once and collect results
             for tool_use_block in tool_uses:
-                tool_name = tool_use_block.name
-                tool_input = tool_use_block.input
-                
-                print(f"🔧 Using tool: {tool_name}")
-                
-                # Execute tool
-                tool_result = self._execute_tool(tool_name, tool_input)
-                
-                tool_results.append({
+                print(f"🔧 Using tool: {tool_use_block.name}")
+            results = await asyncio.gather(*[
+                self._execute_tool_async(tool_use_block.name, tool_use_block.input)
+                for tool_use_block in tool_uses
+            ])
+            tool_results = [
+                {
                     "type": "tool_result",
                     "tool_use_id": tool_use_block.id,
                     "content": json.dumps(tool_result)
-                })
+                }
+                for tool_use_block, tool_result in zip(tool_uses, results)
+            ]
             
             # Add tool results to history
             self.conversation_history.append({
@@ -464,12 +689,7 @@ class ConversationalAnalysisAgent:
             })
             
             # Continue conversation with tool results
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=4096,
-                tools=self.tools,
-                messages=self.conversation_history
-            )
+            response = await self._stream_response(on_text)
         
         # Get final text response
         final_response = ""
@@ -490,6 +710,70 @@ class ConversationalAnalysisAgent:
         })
         
         return final_response if final_response else "No response generated"
+    
+    async def _execute_tool_async(self, tool_name, tool_input):
+        """Run a tool on a worker thread"""
+        return await asyncio.to_thread(self._execute_tool, tool_name, tool_input)
+    
+    async def _stream_response(self, on_text=None):
+        """Stream one Claude turn over the conversation so far and return the final message"""
+        async with self.client.messages.stream(
+            model="claude-sonnet-4-20250514",
+            max_tokens=4096,
+            system=self.system,
+            tools=self.tools,
+            messages=self._request_messages()
+        ) as stream:
+            async for text in stream.text_stream:
+                if on_text:
+                    on_text(text)
+            return await stream.get_final_message()
+
+    def _request_messages(self):
+        """The running summary followed by the messages it doesn't cover"""
+        recent = self.conversation_history[self._summarized:]
+        if not self._summary:
+            return recent
+        return [
+            #unchanged until the next compaction, so it extends the cached prefix
+            {"role": "user", "content": [{
+                "type": "text",
+                "text": f"Summary of our conversation so far:\n{self._summary}",
+                "cache_control": {"type": "ephemeral"}
+            }]},
+            {"role": "assistant", "content": "Understood, I'll keep that context in mind."}
+        ] + recent
+    
+    async def _compact_history(self):
+        """
+        Fold older whole turns into the running summary once the unsummarized history
+        outgrows HISTORY_WINDOW + HISTORY_SUMMARY_BATCH, so each request stays bounded
+        instead of re-sending the full transcript
+        """
+        history = self.conversation_history
+        if len(history) - self._summarized <= HISTORY_WINDOW + HISTORY_SUMMARY_BATCH:
+            return
+        #cut at the start of a question so no tool_use is separated from its tool_result
+        cut = len(history) - HISTORY_WINDOW
+        while cut > self._summarized and not (history[cut]["role"] == "user" and isinstance(history[cut]["content"], str)):
+            cut -= 1
+        if cut <= self._summarized:
+            return
+        previous = f"Summary so far:\n{self._summary}\n\n" if self._summary else ""
+        response = await self.client.messages.create(
+            model=SUMMARY_MODEL,
+            max_tokens=1024,
+            messages=[{
+                "role": "user",
+                "content": (
+                    f"{previous}Update the summary of this data analysis conversation with the turns below. "
+                    "Keep the questions asked, the key numbers and findings, and any files created.\n\n"
+                    f"{_transcript(history[self._summarized:cut])}"
+                )
+            }]
+        )
+        self._summary = "".join(block.text for block in response.content if hasattr(block, "text"))
+        self._summarized = cut
 
 def start_conversation(datasets):
     """Start interactive conversation mode"""
@@ -517,8 +801,15 @@ def start_conversation(datasets):
             if not question:
                 continue
             
-            answer = agent.ask(question)
-            print(f"\n🤖 Agent: {answer}\n")
+            streamed = False
+            def show(text):
+                nonlocal streamed
+                if not streamed:
+                    print("\n🤖 Agent: ", end="")
+                    streamed = True
+                print(text, end="", flush=True)
+            answer = agent.ask(question, on_text=show)
+            print("\n" if streamed else f"\n🤖 Agent: {answer}\n")
             
         except KeyboardInterrupt:
             print("\n\n👋 Goodbye!")
@@ -1,6 +1,14 @@
 import os
 import io
+import json
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -9,6 +17,36 @@ from googleapiclient.http import MediaIoBaseDownload
 
 # Scopes required for Google Drive API
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+# Parsed files are cached here as parquet, one per Drive file id, with a modifiedTime sidecar
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'data-insight')
+# Narrow dtypes for the known Instacart tables, keyed by file name without extension;
+# string columns become categoricals so repeated names are stored once
+ORDER_PRODUCTS_DTYPES = {'order_id': 'int32', 'product_id': 'int32', 'add_to_cart_order': 'int16', 'reordered': 'int8'}
+CSV_DTYPES = {
+    'orders': {
+        'order_id': 'int32', 'user_id': 'int32', 'eval_set': 'category', 'order_number': 'int16',
+        'order_dow': 'int8', 'order_hour_of_day': 'int8', 'days_since_prior_order': 'float32'
+    },
+    'order_products': ORDER_PRODUCTS_DTYPES,
+    'order_products__train': ORDER_PRODUCTS_DTYPES,
+    'order_products__prior': ORDER_PRODUCTS_DTYPES,
+    'products': {'product_id': 'int32', 'product_name': 'category', 'aisle_id': 'int16', 'department_id': 'int8'},
+    'aisles': {'aisle_id': 'int16', 'aisle': 'category'},
+    'departments': {'department_id': 'int8', 'department': 'category'},
+}
+# Drive files are downloaded in ranged chunks of this size; CSVs are parsed as the chunks arrive
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Downloaded chunks allowed to queue up ahead of the CSV parser
+DOWNLOAD_QUEUE_DEPTH = 4
+# Files in a folder are downloaded concurrently by up to this many threads
+DOWNLOAD_WORKERS = 8
+# Column each large table is sorted and indexed on by index_datasets
+INDEX_COLUMNS = {
+    'orders': 'user_id',
+    'order_products': 'order_id',
+    'order_products__train': 'order_id',
+    'order_products__prior': 'order_id',
+}
 
 def authenticate():
     """Authenticate with Google Drive API using OAuth 2.0"""
@@ -29,10 +67,25 @@ def authenticate():
             token.write(creds.to_json())
     return creds
 
+# Credentials are loaded once per process; services are cached per thread
+# because the httplib2 client behind each one isn't thread-safe
+_credentials = None
+_credentials_lock = threading.Lock()
+_thread_local = threading.local()
+
+def _get_credentials():
+    """Authenticate on first use and share the credentials across threads"""
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = authenticate()
+        return _credentials
+
 def get_drive_service():
-    """Create and return Google Drive service"""
-    creds = authenticate()
-    service = build('drive', 'v3', credentials=creds)
+    """Create and return Google Drive service, reused within the calling thread"""
+    service = getattr(_thread_local, 'service', None)
+    if service is None:
+        service = _thread_local.service = build('drive', 'v3', credentials=_get_credentials())
     return service
 
 def list_files_in_folder(folder_id):
@@ -41,58 +94,316 @@ def list_files_in_folder(folder_id):
     query = f"'{folder_id}' in parents and trashed=false"
     results = service.files().list(
         q=query,
-        fields="files(id, name, mimeType, size)"
+        fields="files(id, name, mimeType, size, modifiedTime)"
     ).execute()
     files = results.get('files', [])
     return files
 
-def download_file(file_id, file_name):
-    """Download a file from Google Drive and return as pandas DataFrame"""
-    service = get_drive_service()
-    request = service.files().get_media(fileId=file_id)
-    file_buffer = io.BytesIO()
-    downloader = MediaIoBaseDownload(file_buffer, request)
+class _DownloadPipe(io.RawIOBase):
+    """Readable stream fed with downloaded chunks by a producer thread through a bounded queue"""
+
+    def __init__(self):
+        super().__init__()
+        self._queue = queue.Queue(maxsize=DOWNLOAD_QUEUE_DEPTH)
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._abandoned = threading.Event()
+
+    def readable(self):
+        return True
+
+    def write(self, data):
+        """Called by MediaIoBaseDownload on the producer thread"""
+        if not self._put(bytes(data)):
+            raise IOError("Download reader closed")
+        return len(data)
+
+    def finish(self, error=None):
+        """Signal end of download, or the error that stopped it"""
+        self._put(error)
+
+    def _put(self, item):
+        #stop blocking once the reader has gone away
+        while not self._abandoned.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def readinto(self, buffer):
+        while not self._pending and not self._eof:
+            #pyarrow's readahead threads may still be waiting here when the reader is
+            #abandoned early; treat a closed pipe as end of file so they can exit
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._abandoned.is_set():
+                    return 0
+                continue
+            if item is None:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                self._pending = memoryview(item)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        self._abandoned.set()
+        super().close()
+
+def _download(request, fd, file_name):
+    """Download a media request into fd chunk by chunk"""
+    downloader = MediaIoBaseDownload(fd, request, chunksize=DOWNLOAD_CHUNK_SIZE)
     done = False
     while not done:
         status, done = downloader.next_chunk()
         print(f"Downloading {file_name}: {int(status.progress() * 100)}%")
+
+def _arrow_type(dtype):
+    """Arrow CSV column type for a CSV_DTYPES entry"""
+    if dtype == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+def _csv_convert_options(dtypes):
+    """pyarrow CSV conversion options applying a CSV_DTYPES entry"""
+    return pa_csv.ConvertOptions(
+        column_types={column: _arrow_type(dtype) for column, dtype in dtypes.items()},
+        strings_can_be_null=True
+    )
+
+def _stream_csv(request, file_name, dtypes):
+    """
+    Parse a CSV while it downloads: a producer thread feeds ranged chunks into
+    a pipe that the pyarrow streaming reader consumes block by block, so
+    parsing overlaps the network and the raw file is never held in full.
+    The streaming reader fixes each untyped column's type from the first block,
+    so this returns None, without reading further, unless dtypes covers every column.
+    """
+    pipe = _DownloadPipe()
+
+    def produce():
+        try:
+            _download(request, pipe, file_name)
+        except Exception as e:
+            pipe.finish(e)
+        else:
+            pipe.finish()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        reader = pa_csv.open_csv(
+            io.BufferedReader(pipe, DOWNLOAD_CHUNK_SIZE),
+            read_options=pa_csv.ReadOptions(block_size=DOWNLOAD_CHUNK_SIZE),
+            convert_options=_csv_convert_options(dtypes)
+        )
+        if not set(reader.schema.names) <= set(dtypes):
+            return None
+        table = reader.read_all()
+    finally:
+        pipe.close()
+        producer.join()
+    return table.to_pandas()
+
+def _read_csv(request, file_name, dtypes):
+    """Download a whole CSV, then parse it; the full-file reader promotes inferred types across blocks"""
+    file_buffer = io.BytesIO()
+    _download(request, file_buffer, file_name)
     file_buffer.seek(0)
+    return pa_csv.read_csv(file_buffer, convert_options=_csv_convert_options(dtypes)).to_pandas()
+
+def download_file(file_id, file_name):
+    """Download a file from Google Drive and return as pandas DataFrame"""
+    service = get_drive_service()
+    request = service.files().get_media(fileId=file_id)
     # Read based on file type
     if file_name.endswith('.csv'):
-        df = pd.read_csv(file_buffer)
-    elif file_name.endswith('.xlsx'):
-        df = pd.read_excel(file_buffer)
-    elif file_name.endswith('.json'):
-        df = pd.read_json(file_buffer)
+        dtypes = CSV_DTYPES.get(os.path.splitext(file_name)[0], {})
+        df = _stream_csv(request, file_name, dtypes) if dtypes else None
+        if df is None:
+            df = _read_csv(service.files().get_media(fileId=file_id), file_name, dtypes)
+    elif file_name.endswith(('.xlsx', '.json')):
+        file_buffer = io.BytesIO()
+        _download(request, file_buffer, file_name)
+        file_buffer.seek(0)
+        if file_name.endswith('.xlsx'):
+            df = pd.read_excel(file_buffer)
+        else:
+            df = pd.read_json(file_buffer)
     else:
         raise ValueError(f"Unsupported file type: {file_name}")
     
     print(f"Loaded {file_name}: {df.shape[0]} rows, {df.shape[1]} columns")
     return df
 
-def fetch_from_drive(file_id=None, folder_id=None):
+def _cache_paths(file_id):
+    """Parquet and modifiedTime sidecar paths for a Drive file in CACHE_DIR"""
+    base = os.path.join(CACHE_DIR, file_id)
+    return base + '.parquet', base + '.json'
+
+def load_cached_file(file):
+    """Cached DataFrame for a Drive file listing entry, or None if it is missing or stale"""
+    parquet_path, meta_path = _cache_paths(file['id'])
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('modifiedTime') != file.get('modifiedTime') or not os.path.exists(parquet_path):
+        return None
+    return pd.read_parquet(parquet_path, engine='pyarrow')
+
+def write_atomic(path, write):
+    """
+    Call write(file) on a unique binary temp file beside path, then rename it over path,
+    so readers and concurrent runs never see a partial file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _write_json(data):
+    """write_atomic callback that stores data as JSON"""
+    return lambda f: f.write(json.dumps(data).encode())
+
+def save_cached_file(file, df):
+    """
+    Write a Drive file's DataFrame to CACHE_DIR as zstd parquet plus a modifiedTime sidecar
+    Best effort: a frame parquet cannot hold (e.g. mixed-type object columns) is left uncached
+    """
+    parquet_path, meta_path = _cache_paths(file['id'])
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_atomic(parquet_path, lambda f: df.to_parquet(f, engine='pyarrow', compression='zstd', index=False))
+        write_atomic(meta_path, _write_json({"name": file['name'], "modifiedTime": file.get('modifiedTime')}))
+    except (pa.ArrowException, ValueError, TypeError, OSError) as e:
+        print(f"Warning: could not cache {file['name']}: {e}")
+        return False
+    return True
+
+def _load_file(file, use_cache):
+    """Parsed contents of a Drive file, from the local cache while it is unchanged"""
+    if use_cache:
+        df = load_cached_file(file)
+        if df is not None:
+            print(f"Loaded {file['name']} from cache: {df.shape[0]} rows, {df.shape[1]} columns")
+            return df
+    df = download_file(file['id'], file['name'])
+    if use_cache:
+        save_cached_file(file, df)
+    return df
+
+def save_snapshot(datasets, path):
+    """
+    Dump a datasets dict to path as feather files plus a JSON manifest
+    Best effort: if any dataset cannot be written no manifest is saved, so the
+    snapshot is not restored incomplete; returns whether the snapshot was saved
+    """
+    try:
+        os.makedirs(path, exist_ok=True)
+        for key, df in datasets.items():
+            try:
+                write_atomic(os.path.join(path, f"{key}.feather"), df.to_feather)
+            except (pa.ArrowException, ValueError, TypeError) as e:
+                print(f"Warning: snapshot not saved, could not write dataset {key}: {e}")
+                return False
+        write_atomic(os.path.join(path, 'manifest.json'), _write_json({"datasets": list(datasets)}))
+    except OSError as e:
+        print(f"Warning: snapshot not saved to {path}: {e}")
+        return False
+    return True
+
+def load_snapshot(path):
+    """Restore a datasets dict written by save_snapshot, or None if there is no snapshot"""
+    manifest_path = os.path.join(path, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return {
+        key: pd.read_feather(os.path.join(path, f"{key}.feather"), use_threads=True)
+        for key in manifest["datasets"]
+    }
+
+def index_datasets(datasets):
+    """
+    Sort the large tables on their lookup column and index them by it, so
+    select_rows can find a key's rows by binary search instead of a full scan.
+    The column is kept and the index left unnamed so groupby/merge on it stay unambiguous.
+    """
+    for key, column in INDEX_COLUMNS.items():
+        if key in datasets and column in datasets[key].columns:
+            datasets[key] = index_by(datasets[key], column)
+    return datasets
+
+def index_by(df, column):
+    """Return df sorted on column and indexed by its values, as used by select_rows"""
+    df = df.sort_values(column, kind='stable')
+    df.index = df[column].to_numpy()
+    df.attrs['index_column'] = column
+    return df
+
+def _indexed_by(df, column):
+    """
+    Whether df's index still holds column's values sorted, as index_by left it.
+    attrs survive reset_index, filters and the like, so the index itself is checked too.
+    """
+    index = df.index
+    if df.attrs.get('index_column') != column or isinstance(index, pd.RangeIndex):
+        return False
+    if index.dtype != df[column].dtype or not index.is_monotonic_increasing:
+        return False
+    return len(df) == 0 or (index[0] == df[column].iat[0] and index[-1] == df[column].iat[-1])
+
+def select_rows(df, column, keys):
+    """Rows of df whose column value is in keys, via the sorted index when index_datasets built one"""
+    if not _indexed_by(df, column):
+        return df[df[column].isin(keys)]
+    keys = np.unique(np.asarray(keys))
+    lo = df.index.searchsorted(keys, side='left')
+    hi = df.index.searchsorted(keys, side='right')
+    #expand each [lo, hi) run into row positions without a Python loop
+    lengths = hi - lo
+    offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+    return df.iloc[offsets + np.arange(lengths.sum())]
+
+def fetch_from_drive(file_id=None, folder_id=None, use_cache=True):
     """
     Fetch data from Google Drive
     - If file_id provided: download single file
     - If folder_id provided: download all files in folder
+    - If use_cache: reuse each parsed file from CACHE_DIR while its modifiedTime is unchanged
     """
     if file_id:
         # Get file metadata
         service = get_drive_service()
-        file_metadata = service.files().get(fileId=file_id, fields='name').execute()
-        file_name = file_metadata['name']
-        return download_file(file_id, file_name)
+        file_metadata = service.files().get(fileId=file_id, fields='name, modifiedTime').execute()
+        return _load_file({'id': file_id, **file_metadata}, use_cache)
     elif folder_id:
         # Download all files in folder
         files = list_files_in_folder(folder_id)
-        datasets = {}
-        for file in files:
-            if file['mimeType'] == 'application/vnd.google-apps.folder':
-                continue  # Skip subfolders
-            df = download_file(file['id'], file['name'])
-            # Use filename without extension as key
-            key = os.path.splitext(file['name'])[0]
-            datasets[key] = df
+        files = [f for f in files if f['mimeType'] != 'application/vnd.google-apps.folder']  # Skip subfolders
+        #downloads are I/O bound; get_drive_service gives each worker thread its own client
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            futures = {
+                # Use filename without extension as key
+                os.path.splitext(file['name'])[0]: executor.submit(_load_file, file, use_cache)
+                for file in files
+            }
+            datasets = {key: future.result() for key, future in futures.items()}
         return datasets
     
     else:
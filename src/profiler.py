@@ -1,8 +1,165 @@
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.preprocessing import LabelEncoder
 import json
+from joblib import Parallel, delayed
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+try:
+    import bottleneck as bn
+except ImportError:
+    bn = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Number of strongest numeric correlation pairs reported per dataset
+TOP_CORRELATIONS = 15
+# Correlation pairs at least this many use the numba top-k kernel when numba is installed
+NUMBA_MIN_PAIRS = 100_000
+# Summary statistics reported for every numeric column
+NUMERIC_STATS = ['mean', 'median', 'std', 'min', 'max']
+# Several datasets totalling at least this many rows are profiled in parallel worker processes
+PARALLEL_MIN_ROWS = 10_000
+
+if njit is not None:
+    @njit(cache=True)
+    def _top_k_abs_kernel(values, k):
+        """Indices of the k largest |values|, largest first, ties in index order and NaN last"""
+        k = min(k, len(values))
+        top = np.empty(k, np.int64)
+        scores = np.empty(k, np.float64)
+        filled = 0
+        for i in range(len(values)):
+            score = -1.0 if np.isnan(values[i]) else abs(values[i])
+            if filled == k and score <= scores[k - 1]:
+                continue
+            #insert into the sorted buffer, dropping the weakest once full; equal scores stay ahead
+            j = filled if filled < k else k - 1
+            while j > 0 and scores[j - 1] < score:
+                scores[j] = scores[j - 1]
+                top[j] = top[j - 1]
+                j -= 1
+            scores[j] = score
+            top[j] = i
+            if filled < k:
+                filled += 1
+        return top
+
+def _correlation_matrix(values):
+    """
+    Pearson correlation of the columns of a 2-D float array via matrix products (BLAS GEMM).
+    Matches DataFrame.corr(): each pair uses the rows where both columns are present.
+    """
+    if len(values) == 0:
+        return np.full((values.shape[1], values.shape[1]), np.nan)
+    valid = ~np.isnan(values)
+    #shifting each column by its first present value keeps the sums well conditioned
+    #and makes constant columns exactly zero, so they come out NaN as in pandas
+    values = values - values[valid.argmax(axis=0), np.arange(values.shape[1])]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if valid.all():
+            #centered in float64, then the normalize and GEMM run in float32 at half the memory traffic
+            x = (values - values.mean(axis=0)).astype(np.float32)
+            x /= np.sqrt((x * x).sum(axis=0))
+            corr = (x.T @ x).astype(np.float64)
+        else:
+            x = np.where(valid, values, 0.0)
+            m = valid.astype(np.float64)
+            n = m.T @ m
+            #per pair sums of each column over the rows both columns share
+            sum_x = x.T @ m
+            sum_xx = (x * x).T @ m
+            cov = x.T @ x - sum_x * sum_x.T / n
+            var = sum_xx - sum_x * sum_x / n
+            #a column that is constant over the rows it shares with another leaves only rounding error
+            var[var <= sum_xx * 1e-13] = np.nan
+            corr = cov / np.sqrt(var * var.T)
+    return np.clip(corr, -1.0, 1.0)
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, largest first, ties kept in index order"""
+    if len(scores) > k:
+        #partition finds the k-th largest score; only scores at or above it get sorted
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))][:k]
+
+def _native_list(values):
+    """Series.tolist() with pd.NA (nullable and Arrow-backed dtypes) as None, like to_dict('records')"""
+    if getattr(values.dtype, 'na_value', None) is pd.NA:
+        return [None if value is pd.NA else value for value in values.tolist()]
+    return values.tolist()
+
+def _sample_records(head):
+    """Rows of a small frame as JSON-ready dicts, converted column by column rather than cell by cell"""
+    columns = [_native_list(values) for _, values in head.items()]
+    return [dict(zip(head.columns, row)) for row in zip(*columns)]
+
+def _numeric_stats(numeric):
+    """
+    NUMERIC_STATS for each column of a numeric frame, indexed by statistic
+    Arrow-backed columns (e.g. read_csv(..., engine='pyarrow', dtype_backend='pyarrow')) go through
+    DataFrame.agg, which runs pyarrow.compute kernels on their buffers without a float64 copy
+    """
+    if numeric.shape[1] == 0:
+        return pd.DataFrame(index=NUMERIC_STATS, dtype=float)
+    arrow = np.array([isinstance(dtype, pd.ArrowDtype) for dtype in numeric.dtypes])
+    if bn is None or len(numeric) == 0 or arrow.all():
+        return numeric.agg(NUMERIC_STATS)
+    if not arrow.any():
+        return _bottleneck_stats(numeric)
+    stats = pd.concat([_bottleneck_stats(numeric.loc[:, ~arrow]), numeric.loc[:, arrow].agg(NUMERIC_STATS)], axis=1)
+    return stats[numeric.columns]
+
+def _bottleneck_stats(numeric):
+    """NUMERIC_STATS per column via bottleneck, one contiguous NaN-skipping scan per statistic"""
+    values = numeric.to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.DataFrame({
+        'mean': bn.nanmean(values, axis=0),
+        'median': bn.nanmedian(values, axis=0),
+        'std': bn.nanstd(values, axis=0, ddof=1),
+        'min': bn.nanmin(values, axis=0),
+        'max': bn.nanmax(values, axis=0),
+    }, index=numeric.columns).T
+
+def _is_sequential_id(series, unique_count):
+    """Integer column with a distinct value on every row, in increasing order (a row id)"""
+    return (
+        pd.api.types.is_integer_dtype(series.dtype)
+        and unique_count == len(series)
+        and series.is_monotonic_increasing
+    )
+
+def _category_counts(series):
+    """Distinct non-null values of a column and how often each occurs, from one factorize/bincount pass"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        #every category is reported, unused ones with a zero count, as value_counts does;
+        #an ordered index keeps mode's tie-break on category order
+        categories = series.cat.categories
+        codes = series.cat.codes.to_numpy()
+        uniques = pd.CategoricalIndex(categories, categories=categories, ordered=True)
+    else:
+        codes, uniques = pd.factorize(series)
+    return uniques, np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+def _most_common(uniques, counts):
+    """Series.mode()[0] from distinct values and counts: the smallest of the most frequent values"""
+    if len(counts) == 0 or counts.max() == 0:
+        return None
+    tied = uniques[counts == counts.max()]
+    if len(tied) == 1:
+        return tied[0]
+    try:
+        return tied.sort_values()[0]
+    except TypeError:
+        #unorderable mixed values, mode() leaves them unsorted too
+        return tied[0]
 
 def profile_dataset(df, target_column=None, dataset_name="dataset"):
     """
@@ -31,72 +188,111 @@ def profile_dataset(df, target_column=None, dataset_name="dataset"):
     numeric_cols = df.select_dtypes(include=[np.number]).columns
     categorical_cols = df.select_dtypes(include=['object', 'category']).columns
     
+    #all numeric stats in one aggregation instead of six reductions per column
+    stats = _numeric_stats(df[numeric_cols])
+    category_counts = {col: _category_counts(df[col]) for col in categorical_cols}
+    #distinct counts for every profiled column, shared with assess_data_quality
+    nunique = pd.Series(
+        df[numeric_cols].nunique().tolist()
+        + [np.count_nonzero(counts) for _, counts in category_counts.values()],
+        index=numeric_cols.append(categorical_cols), dtype=np.int64
+    )
     for col in numeric_cols:
+        col_stats = stats[col]
         profile["summary_stats"][col] = {
             "type": "numeric",
-            "mean": float(df[col].mean()),
-            "median": float(df[col].median()),
-            "std": float(df[col].std()),
-            "min": float(df[col].min()),
-            "max": float(df[col].max()),
-            "unique_count": int(df[col].nunique())
+            "mean": float(col_stats['mean']),
+            "median": float(col_stats['median']),
+            "std": float(col_stats['std']),
+            "min": float(col_stats['min']),
+            "max": float(col_stats['max']),
+            "unique_count": int(nunique[col])
         }
     
     for col in categorical_cols:
-        value_counts = df[col].value_counts().head(10)
+        uniques, counts = category_counts[col]
+        #most frequent first; equal counts keep first-appearance (category) order
+        top = np.argsort(-counts, kind='stable')[:10]
+        most_common = _most_common(uniques, counts)
         profile["summary_stats"][col] = {
             "type": "categorical",
-            "unique_count": int(df[col].nunique()),
-            "top_values": {str(k): int(v) for k, v in value_counts.items()},
-            "most_common": str(df[col].mode()[0]) if len(df[col].mode()) > 0 else None
+            "unique_count": int(nunique[col]),
+            "top_values": dict(zip(map(str, uniques[top]), counts[top].tolist())),
+            "most_common": str(most_common) if most_common is not None else None
         }
     
-    #numeric correlations
-    if len(numeric_cols) > 1:
-        corr_matrix = df[numeric_cols].corr()
-        #top correlations
-        corr_pairs = []
-        for i in range(len(corr_matrix.columns)):
-            for j in range(i+1, len(corr_matrix.columns)):
-                corr_pairs.append({
-                    "feature1": corr_matrix.columns[i],
-                    "feature2": corr_matrix.columns[j],
-                    "correlation": float(corr_matrix.iloc[i, j])
-                })
-        #absolute correlation
-        corr_pairs = sorted(corr_pairs, key=lambda x: abs(x["correlation"]), reverse=True)
-        profile["correlations"] = corr_pairs[:15]  # Top 15
+    #numeric correlations, leaving out columns that cannot correlate meaningfully:
+    #constant, single-value or all-NaN ones (all NaN correlations) and sequential integer ids
+    corr_cols = numeric_cols[[
+        nunique[col] > 1 and not _is_sequential_id(df[col], nunique[col])
+        for col in numeric_cols
+    ]]
+    if len(corr_cols) > 1:
+        corr = _correlation_matrix(df[corr_cols].to_numpy(dtype=np.float64, na_value=np.nan))
+        #top correlations by absolute value over the upper triangle; undefined (NaN) ones rank last
+        rows, cols = np.triu_indices(len(corr_cols), k=1)
+        values = corr[rows, cols]
+        if njit is not None and len(values) >= NUMBA_MIN_PAIRS:
+            #one pass with a k-slot buffer, no temporaries over all pairs
+            top = _top_k_abs_kernel(values, TOP_CORRELATIONS)
+        else:
+            top = _top_k(np.nan_to_num(np.abs(values), nan=-1.0), TOP_CORRELATIONS)
+        profile["correlations"] = [
+            {
+                "feature1": corr_cols[rows[i]],
+                "feature2": corr_cols[cols[i]],
+                "correlation": float(values[i])
+            }
+            for i in top
+        ]
     
     #how important each feature is
     if target_column and target_column in df.columns:
         importance = calculate_feature_importance(df, target_column)
         profile["feature_importance"] = importance
-    profile["data_quality"] = assess_data_quality(df)
-    profile["sample_data"] = df.head(5).to_dict('records')
+    profile["data_quality"] = assess_data_quality(
+        df, missing=missing, std_series=stats.loc['std'], nunique_series=nunique,
+        numeric_cols=numeric_cols, categorical_cols=categorical_cols
+    )
+    profile["sample_data"] = _sample_records(df.head(5))
     return profile
 
-def calculate_feature_importance(df, target_column, max_features=15):
-    """Calculate feature importance using Random Forest"""
+def calculate_feature_importance(df, target_column, max_features=15, sample_size=50000):
+    """
+    Calculate feature importance using Random Forest
+    sample_size: fit on at most this many rows (stratified by class for classification); None uses all rows
+    """
     try:
         #clean and prep data
         df_clean = df.dropna(subset=[target_column])
+        is_classification = df_clean[target_column].dtype == 'object' or df_clean[target_column].nunique() < 20
+        #importance rankings are stable on a sample, and tree building is O(n log n) per tree
+        if sample_size and len(df_clean) > sample_size:
+            if is_classification:
+                df_clean = df_clean.groupby(target_column, group_keys=False, observed=True).sample(
+                    frac=sample_size / len(df_clean), random_state=42
+                )
+            else:
+                df_clean = df_clean.sample(n=sample_size, random_state=42)
         X = df_clean.drop(columns=[target_column])
         y = df_clean[target_column]
         
-        # Encode categorical variables
-        le_dict = {}
+        # Encode categorical variables as integer codes, in sorted label order; missing values become -1
         for col in X.select_dtypes(include=['object', 'category']).columns:
-            le = LabelEncoder()
-            X[col] = le.fit_transform(X[col].astype(str))
-            le_dict[col] = le
+            if isinstance(X[col].dtype, pd.CategoricalDtype):
+                X[col] = X[col].cat.codes
+            else:
+                X[col] = pd.factorize(X[col], sort=True)[0]
+        
+        #the forest works in float32 internally, so cast once here instead of inside fit
+        X = X.astype(np.float32)
         
         # Determine if classification or regression
-        if y.dtype == 'object' or y.nunique() < 20:
-            le_target = LabelEncoder()
-            y = le_target.fit_transform(y.astype(str))
-            model = RandomForestClassifier(n_estimators=100, random_state=42, max_depth=10)
+        if is_classification:
+            y = pd.factorize(y, sort=True)[0]
+            model = RandomForestClassifier(n_estimators=100, random_state=42, max_depth=10, n_jobs=-1)
         else:
-            model = RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10)
+            model = RandomForestRegressor(n_estimators=100, random_state=42, max_depth=10, n_jobs=-1)
         
         # Fit model
         model.fit(X, y)
@@ -112,10 +308,18 @@ def calculate_feature_importance(df, target_column, max_features=15):
     except Exception as e:
         return {"error": str(e)}
 
-def assess_data_quality(df):
-    """Assess data quality issues"""
+def assess_data_quality(df, missing=None, std_series=None, nunique_series=None,
+                        numeric_cols=None, categorical_cols=None):
+    """
+    Assess data quality issues
+    missing, std_series, nunique_series: optional precomputed df.isnull().sum(),
+    numeric column std and per-column nunique, as profile_dataset already has them
+    numeric_cols, categorical_cols: optional precomputed select_dtypes column selections
+    """
     issues = []
-    missing_pct = (df.isnull().sum() / len(df) * 100)
+    if missing is None:
+        missing = df.isnull().sum()
+    missing_pct = (missing / len(df) * 100)
     high_missing = missing_pct[missing_pct > 50]
     if len(high_missing) > 0:
         issues.append({
@@ -123,8 +327,8 @@ def assess_data_quality(df):
             "columns": list(high_missing.index),
             "severity": "high"
         })
-    #duplicate rows
-    dup_count = df.duplicated().sum()
+    #duplicate rows; a single hashed pass over the rows, counted straight off the boolean mask
+    dup_count = np.count_nonzero(df.duplicated().to_numpy())
     if dup_count > 0:
         issues.append({
             "type": "duplicate_rows",
@@ -132,24 +336,28 @@ def assess_data_quality(df):
             "percentage": float(dup_count / len(df) * 100),
             "severity": "medium"
         })
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    for col in numeric_cols:
-        if df[col].std() == 0:
-            issues.append({
-                "type": "zero_variance",
-                "column": col,
-                "severity": "low"
-            })
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns
-    for col in categorical_cols:
-        unique_ratio = df[col].nunique() / len(df)
-        if unique_ratio > 0.9:
-            issues.append({
-                "type": "high_cardinality",
-                "column": col,
-                "unique_ratio": float(unique_ratio),
-                "severity": "medium"
-            })
+    if numeric_cols is None:
+        numeric_cols = df.select_dtypes(include=[np.number]).columns
+    if std_series is None:
+        std_series = df[numeric_cols].std()
+    for col in std_series.index[std_series == 0]:
+        issues.append({
+            "type": "zero_variance",
+            "column": col,
+            "severity": "low"
+        })
+    if categorical_cols is None:
+        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
+    if nunique_series is None:
+        nunique_series = df[categorical_cols].nunique()
+    unique_ratio = nunique_series.reindex(categorical_cols) / len(df)
+    for col, ratio in unique_ratio[unique_ratio > 0.9].items():
+        issues.append({
+            "type": "high_cardinality",
+            "column": col,
+            "unique_ratio": float(ratio),
+            "severity": "medium"
+        })
     
     return issues
 
@@ -159,18 +367,37 @@ def profile_multiple_datasets(datasets_dict, relationships=None):
     datasets_dict: {name: dataframe}
     relationships: list of dicts with 'dataset1', 'dataset2', 'key' fields
     """
-    profiles = {}
-    for name, df in datasets_dict.items():
-        profiles[name] = profile_dataset(df, dataset_name=name)
+    total_rows = sum(len(df) for df in datasets_dict.values())
+    #datasets profile independently; below the threshold worker start-up costs more than it saves
+    if len(datasets_dict) >= 2 and total_rows > PARALLEL_MIN_ROWS:
+        results = Parallel(n_jobs=-1, backend='loky')(
+            delayed(profile_dataset)(df, dataset_name=name) for name, df in datasets_dict.items()
+        )
+    else:
+        results = [profile_dataset(df, dataset_name=name) for name, df in datasets_dict.items()]
+    profiles = dict(zip(datasets_dict.keys(), results))
     if relationships:
         profiles["relationships"] = relationships
     profiles["overview"] = {
         "total_datasets": len(datasets_dict),
-        "total_rows": sum(len(df) for df in datasets_dict.values()),
+        "total_rows": total_rows,
         "total_columns": sum(len(df.columns) for df in datasets_dict.values())
     }
     return profiles
 
+def profile_to_json(profile):
+    """
+    Serialize a profile (or profile_multiple_datasets result) to an indented JSON string
+    Uses orjson when installed, falling back to json.dumps
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            profile,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            default=str
+        ).decode()
+    return json.dumps(profile, indent=2, default=str)
+
 # Example usage
 if __name__ == "__main__":
     #sample dataframe
@@ -183,4 +410,4 @@ if __name__ == "__main__":
     })
     
     profile = profile_dataset(sample_df, target_column='category')
-    print(json.dumps(profile, indent=2))
\ No newline at end of file
+    print(profile_to_json(profile))
\ No newline at end of file